@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
-import json
+import hashlib
+import orjson
 import time
 from io import BytesIO
 
@@ -8,16 +9,30 @@ from services.ingest import extract_proposal_texts, extract_pdf_text_from_urls
 from services.calls import fetch_calls, NSF_FUNDING_RSS, DOE_OSC_FOA_RSS
 from services.profile import build_prof_profile
 from services.match import rank_calls
+from services.llm_cache import cache_stats
 
 st.set_page_config(page_title="GrantMatch", layout="wide")
 st.title("GrantMatch Assistant")
 
 # ---------- Cache wrappers ----------
+def _bytes_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _text_hash(text: str) -> str:
+    return _bytes_hash((text or "").encode("utf-8"))
+
+# Keyed on content hashes; Streamlit skips hashing the underscore-prefixed text args.
 @st.cache_data(show_spinner=False)
-def cached_profile(pub_text: str, proposal_text: str):
-    return build_prof_profile(pub_text, proposal_text)
+def cached_profile(pub_hash: str, proposal_hash: str, _pub_text: str, _proposal_text: str):
+    return build_prof_profile(_pub_text, _proposal_text)
 
-@st.cache_data(ttl=24*3600, show_spinner=False)
+# Uploads rarely change between clicks; skip re-parsing PDFs/DOCX with the same name + content.
+@st.cache_data(show_spinner=False)
+def cached_proposal_texts(file_hashes: tuple, _files) -> str:
+    return extract_proposal_texts(_files)
+
+# Short TTL is cheap: feeds are revalidated with ETag/Last-Modified (see services/calls.py)
+@st.cache_data(ttl=10*60, show_spinner=False)
 def cached_calls(use_nsf: bool, use_doe: bool, use_grants: bool, keywords: tuple):
     return fetch_calls(
         use_nsf=use_nsf,
@@ -43,6 +58,8 @@ def _combine_publication_inputs(publications_text: str, summaries_text: str, pdf
 
     return "\n\n".join(parts).strip()
 
+_BUNDLE_TEXT_KEYS = ("publication_pdf_urls", "publications_text", "publication_summaries_text", "proposals_text")
+
 def _make_project_bundle() -> dict:
     return {
         "publication_pdf_urls": st.session_state.get("publication_pdf_urls", ""),
@@ -54,12 +71,17 @@ def _make_project_bundle() -> dict:
         "version": "grantmatch_project_bundle_v1",
     }
 
+def _set_profile(profile):
+    # Every profile assignment bumps profile_rev, so "profile changed" is a cheap int compare.
+    st.session_state.profile = profile
+    st.session_state.profile_rev = st.session_state.get("profile_rev", 0) + 1
+
 def _load_project_bundle(bundle: dict):
     st.session_state.publication_pdf_urls = bundle.get("publication_pdf_urls", "")
     st.session_state.publications_text = bundle.get("publications_text", "")
     st.session_state.publication_summaries_text = bundle.get("publication_summaries_text", "")
     st.session_state.proposals_text = bundle.get("proposals_text", "")
-    st.session_state.profile = bundle.get("profile", None)
+    _set_profile(bundle.get("profile", None))
 
     # reset downstream computed items so rerun is explicit
     st.session_state.calls = None
@@ -74,6 +96,7 @@ defaults = {
     "publication_summaries_text": "",
     "proposals_text": "",
     "profile": None,
+    "profile_rev": 0,
     "calls": None,
     "call_errors": [],
     "ranked_calls": None,
@@ -92,7 +115,7 @@ with st.sidebar:
     project_json_file = st.file_uploader("Load project JSON", type=["json"], key="project_json_loader")
     if project_json_file is not None:
         try:
-            loaded = json.load(project_json_file)
+            loaded = orjson.loads(project_json_file.getvalue())
             _load_project_bundle(loaded)
             st.success("Loaded project JSON.")
         except Exception as e:
@@ -162,7 +185,8 @@ if run_btn:
     with st.spinner("Reading prior proposals..."):
         # Only re-extract if new files uploaded this run; otherwise keep loaded text if any
         if proposal_files:
-            st.session_state.proposals_text = extract_proposal_texts(proposal_files)
+            file_hashes = tuple(f"{f.name}:{_bytes_hash(f.getvalue())}" for f in proposal_files)
+            st.session_state.proposals_text = cached_proposal_texts(file_hashes, proposal_files)
         st.session_state.last_step = "proposals_loaded"
 
     with st.spinner("Building professor profile..."):
@@ -176,6 +200,9 @@ if run_btn:
             st.error("Please paste publication titles/list (and optionally summaries) before running.")
             st.stop()
 
+        # for the debug line; avoids rebuilding the combined text on every rerun
+        st.session_state._pub_chars = len(pubs_combined)
+
         can_reuse = (
             reuse_saved_profile
             and isinstance(st.session_state.get("profile"), dict)
@@ -186,10 +213,24 @@ if run_btn:
             st.info("Reusing saved profile from loaded project JSON.")
             st.session_state.last_step = "profile_reused"
         else:
-            st.session_state.profile = cached_profile(pubs_combined, st.session_state.proposals_text or "")
+            proposals_text = st.session_state.proposals_text or ""
+            st.session_state.pub_hash = _text_hash(pubs_combined)
+            st.session_state.proposal_hash = _text_hash(proposals_text)
+            _set_profile(cached_profile(
+                st.session_state.pub_hash,
+                st.session_state.proposal_hash,
+                pubs_combined,
+                proposals_text,
+            ))
             st.session_state.last_step = "profile_built"
 
     profile = st.session_state.profile if isinstance(st.session_state.profile, dict) else {}
+    truncated = profile.get("publications_truncated")
+    if isinstance(truncated, dict):
+        st.warning(
+            f"Publication text is very long: only the first {truncated.get('used_chars', 0):,} characters "
+            f"were used for the profile ({truncated.get('dropped_chars', 0):,} characters at the end were skipped)."
+        )
     methods = profile.get("methods_keywords", []) if isinstance(profile.get("methods_keywords", []), list) else []
     keywords = tuple(methods)
 
@@ -242,9 +283,21 @@ if rerun_btn:
         st.session_state.last_step = "calls_reranked"
 
 # ---------- Save project JSON ----------
-bundle = _make_project_bundle()
+# This runs on every rerun; only re-serialize when the bundled inputs changed.
+# (str hashes are cached on the object, so checking unchanged text is cheap.)
+bundle_sig = (
+    tuple(hash(st.session_state.get(k) or "") for k in _BUNDLE_TEXT_KEYS),
+    st.session_state.get("profile_rev"),
+    st.session_state.get("last_step"),
+)
+if st.session_state.get("_bundle_sig") != bundle_sig:
+    st.session_state._bundle_bytes = orjson.dumps(
+        _make_project_bundle(),
+        option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS,
+    )
+    st.session_state._bundle_sig = bundle_sig
 bundle_name = ("grantmatch_project").strip().replace(" ", "_")
-bundle_bytes = json.dumps(bundle, ensure_ascii=False, indent=2).encode("utf-8")
+bundle_bytes = st.session_state._bundle_bytes
 
 st.download_button(
     label="Save Project JSON",
@@ -258,10 +311,11 @@ st.download_button(
 st.write(
     "Debug:",
     "last_step=", st.session_state.get("last_step"),
-    "pub_chars=", len(_combine_publication_inputs(st.session_state.publications_text, st.session_state.publication_summaries_text)),
+    "pub_chars=", st.session_state.get("_pub_chars", 0),
     "proposal_chars=", len(st.session_state.get("proposals_text") or ""),
     "calls=", len(st.session_state.get("calls") or []),
     "ranked=", len(st.session_state.get("ranked_calls") or []),
+    "llm_cache=", cache_stats(),
 )
 
 if st.session_state.get("call_errors"):
@@ -1,10 +1,11 @@
 # services/calls.py
 from __future__ import annotations
 import feedparser
-import requests
-from typing import Dict, List, Tuple, Optional
-import ssl, certifi
-from urllib.request import urlopen
+import orjson
+from typing import Callable, Dict, List, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+
+from services.http_session import make_session, max_request_time_s
 
 # NSF RSS directory exists; this is a commonly used NSF funding feed.
 NSF_FUNDING_RSS = "https://www.nsf.gov/rss/rss_www_funding.xml"
@@ -13,35 +14,82 @@ NSF_FUNDING_RSS = "https://www.nsf.gov/rss/rss_www_funding.xml"
 # If this URL ever fails, we can swap to another DOE RSS feed from their RSS directory.
 DOE_OSC_FOA_RSS = "https://science.osti.gov/rss/foa.xml"
 
-def _fetch_url_bytes(url: str, timeout: int = 20) -> bytes:
-    ctx = ssl.create_default_context(cafile=certifi.where())
-    with urlopen(url, timeout=timeout, context=ctx) as r:
-        return r.read()
+# Per-request bounds: an RSS download, and the (slower) Grants.gov search.
+RSS_TIMEOUT_S = 20
+GRANTS_GOV_TIMEOUT_S = 30
+
+# Sources are fetched concurrently; give up on any source still running after
+# this. Kept above the worst case of every request, session retries and backoff
+# included, so a slow but successful response isn't discarded.
+SOURCE_TIMEOUT_S = max(max_request_time_s(RSS_TIMEOUT_S), max_request_time_s(GRANTS_GOV_TIMEOUT_S)) + 1
+
+# Pooled keep-alive session for RSS feeds and Grants.gov; reuses TLS connections
+# across fetches (requests verifies against certifi's CA bundle).
+_SESSION = make_session()
+
+# Conditional-GET cache for RSS feeds: {url: {"etag", "last_modified", "items"}}.
+# Lives as long as the server process, so later fetches revalidate with the feed
+# server (cheap 304) instead of re-downloading and re-parsing unchanged feeds.
+_FEED_CACHE: Dict[str, Dict] = {}
+
+# Output field -> candidate source keys, in priority order.
+# RSS and Grants.gov records already use the output names, so they hit on the first key.
+_FIELD_MAP: Dict[str, Tuple[str, ...]] = {
+    "agency": ("agency", "source"),
+    "title": ("title", "opportunityTitle", "name"),
+    "deadline": ("deadline", "closeDate", "dueDate"),
+    "published": ("published", "postDate", "publishDate"),
+    "link": ("link", "url", "opportunityURL", "href"),
+    "summary": ("summary", "synopsis", "description"),
+}
 
 def _normalize_call(c: dict, agency_default: str = "") -> dict:
     # map many possible field names into one schema
-    return {
-        "agency": c.get("agency") or c.get("source") or agency_default,
-        "title": c.get("title") or c.get("opportunityTitle") or c.get("name") or "",
-        "deadline": c.get("deadline") or c.get("closeDate") or c.get("dueDate") or "",
-        "published": c.get("published") or c.get("postDate") or c.get("publishDate") or "",
-        "link": c.get("link") or c.get("url") or c.get("opportunityURL") or c.get("href") or "",
-        "summary": c.get("summary") or c.get("synopsis") or c.get("description") or "",
+    out = {
+        field: next((v for k in keys if (v := c.get(k))), "")
+        for field, keys in _FIELD_MAP.items()
     }
+    if not out["agency"]:
+        out["agency"] = agency_default
+    return out
 
 
-def _fetch_rss(url: str, agency: str, limit: int = 50) -> List[Dict]:
-    # IMPORTANT: Don't let feedparser fetch the URL itself (it won't use our SSL context).
-    data = _fetch_url_bytes(url, timeout=20)  # uses certifi-based SSL context
-    feed = feedparser.parse(data)
+def _fetch_rss(url: str, agency: str, limit: int = 50) -> Tuple[List[Dict], List[str]]:
+    """
+    Returns (calls, warnings). Parse problems are only fatal when they leave no entries.
+    """
+    warnings: List[str] = []
+    cached = _FEED_CACHE.get(url)
+
+    # Conditional GET (If-None-Match / If-Modified-Since) with a hard timeout;
+    # feedparser's own fetcher has none, so it only parses the downloaded bytes.
+    headers = {}
+    if cached and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached["last_modified"]:
+        headers["If-Modified-Since"] = cached["last_modified"]
+    r = _SESSION.get(url, headers=headers, timeout=RSS_TIMEOUT_S)
+
+    if r.status_code == 304 and cached:
+        # feed unchanged since last fetch
+        return list(cached["items"][:limit]), warnings
+    if r.status_code >= 400:
+        raise RuntimeError(f"RSS fetch failed: HTTP {r.status_code}")
+
+    # response headers let feedparser pick up the declared charset
+    feed = feedparser.parse(r.content, response_headers={k.lower(): v for k, v in r.headers.items()})
+    entries = getattr(feed, "entries", []) or []
 
-    # feedparser puts errors in feed.bozo / feed.bozo_exception
+    # feedparser puts parse errors in feed.bozo / feed.bozo_exception.
+    # bozo is also set for benign quirks (e.g. undeclared namespaces), so keep whatever parsed.
     if getattr(feed, "bozo", 0):
-        raise RuntimeError(f"RSS parse error: {getattr(feed, 'bozo_exception', 'unknown')}")
+        bozo_exc = getattr(feed, "bozo_exception", "unknown")
+        if not entries:
+            raise RuntimeError(f"RSS parse error: {bozo_exc}")
+        warnings.append(f"RSS parse warning (entries kept): {bozo_exc}")
 
-    entries = getattr(feed, "entries", []) or []
     out = []
-    for e in entries[:limit]:
+    for e in entries:
         title = getattr(e, "title", "") or ""
         link = getattr(e, "link", "") or ""
         published = getattr(e, "published", "") or getattr(e, "updated", "") or ""
@@ -56,7 +104,12 @@ def _fetch_rss(url: str, agency: str, limit: int = 50) -> List[Dict]:
             "summary": summary,
             "source": f"{agency.lower()}_rss",
         })
-    return out
+
+    etag = r.headers.get("ETag")
+    last_modified = r.headers.get("Last-Modified")
+    if etag or last_modified:
+        _FEED_CACHE[url] = {"etag": etag, "last_modified": last_modified, "items": out}
+    return out[:limit], warnings
 
 
 def _fetch_grants_gov(keywords: List[str] | None = None, limit: int = 50) -> List[Dict]:
@@ -69,17 +122,14 @@ def _fetch_grants_gov(keywords: List[str] | None = None, limit: int = 50) -> Lis
         "keyword": " ".join(keywords[:10]),
         "rows": limit
     }
-    r = requests.post(url, json=payload, timeout=30)
+    r = _SESSION.post(url, json=payload, timeout=GRANTS_GOV_TIMEOUT_S)
     r.raise_for_status()
-    data = r.json()
+    data = orjson.loads(r.content)
 
     # Best-effort normalization
     items = data.get("opportunities") or data.get("data") or []
-    out = []
-    for it in items:
-        if not isinstance(it, dict):
-            continue
-        out.append({
+    return [
+        {
             "agency": it.get("agency", "Grants.gov"),
             "title": it.get("title", ""),
             "link": it.get("opportunityNumber", ""),  # you can map to real URL later
@@ -87,8 +137,10 @@ def _fetch_grants_gov(keywords: List[str] | None = None, limit: int = 50) -> Lis
             "summary": it.get("description", "") or "",
             "deadline": it.get("closeDate", "") or "",
             "source": "grants.gov",
-        })
-    return out
+        }
+        for it in items
+        if isinstance(it, dict)
+    ]
 
 def fetch_calls(
     use_nsf: bool = True,
@@ -101,27 +153,39 @@ def fetch_calls(
     errors: List[str] = []
     print("NSF RSS:", NSF_FUNDING_RSS)
     print("DOE RSS:", DOE_OSC_FOA_RSS)
+    kw = list(keywords) if keywords else []
+    sources: List[Tuple[str, Callable[[], Tuple[List[Dict], List[str]]]]] = []
     if use_nsf:
-        try:
-            nsf = _fetch_rss(NSF_FUNDING_RSS, "NSF", limit_each)
-            calls.extend(nsf)
-        except Exception as e:
-            errors.append(f"NSF RSS failed: {e}")
-
+        sources.append(("NSF RSS", lambda: _fetch_rss(NSF_FUNDING_RSS, "NSF", limit_each)))
     if use_doe:
-        try:
-            doe = _fetch_rss(DOE_OSC_FOA_RSS, "DOE", limit_each)
-            calls.extend(doe)
-        except Exception as e:
-            errors.append(f"DOE RSS failed: {e}")
-
+        sources.append(("DOE RSS", lambda: _fetch_rss(DOE_OSC_FOA_RSS, "DOE", limit_each)))
     if use_grants:
+        sources.append(("Grants.gov", lambda: (_fetch_grants_gov(kw, limit=min(limit_each, 50)), [])))
+
+    # Each source is a blocking network round-trip; run them side by side.
+    results: Dict[str, List[Dict]] = {}
+    if sources:
+        pool = ThreadPoolExecutor(max_workers=len(sources))
+        futures = {pool.submit(fn): name for name, fn in sources}
         try:
-            kw = list(keywords) if keywords else []
-            gg = _fetch_grants_gov(kw, limit=min(limit_each, 50))
-            calls.extend(gg)
-        except Exception as e:
-            errors.append(f"Grants.gov failed: {e}")
+            for fut in as_completed(futures, timeout=SOURCE_TIMEOUT_S):
+                name = futures[fut]
+                try:
+                    results[name], warnings = fut.result()
+                    errors.extend(f"{name}: {w}" for w in warnings)
+                except Exception as e:
+                    errors.append(f"{name} failed: {e}")
+        except FuturesTimeout:
+            for fut, name in futures.items():
+                if not fut.done():
+                    errors.append(f"{name} failed: timed out after {SOURCE_TIMEOUT_S}s")
+        finally:
+            # don't block the UI on a hung source
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # keep source order stable regardless of completion order
+    for name, _ in sources:
+        calls.extend(results.get(name) or [])
 
     # normalize + filter
     normalized: List[Dict] = []
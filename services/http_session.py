@@ -0,0 +1,41 @@
+# services/http_session.py
+from __future__ import annotations
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0 Safari/537.36"
+)
+
+# Retries cover only failures that come back quickly: connection errors and
+# 429/502/503 answers. Read timeouts are not retried (each retry would cost a
+# whole timeout again), and Retry-After is ignored so a server can't stall a
+# caller for as long as it likes.
+SESSION_RETRIES = 2
+SESSION_BACKOFF_S = 0.3
+
+
+def make_session() -> requests.Session:
+    """Pooled keep-alive session: repeat hosts skip the TCP+TLS handshake."""
+    session = requests.Session()
+    session.headers.update({"User-Agent": DEFAULT_UA})
+    session.mount("https://", HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=SESSION_RETRIES,
+            read=0,
+            backoff_factor=SESSION_BACKOFF_S,
+            status_forcelist=[429, 502, 503],
+            respect_retry_after_header=False,
+        ),
+    ))
+    return session
+
+
+def max_request_time_s(timeout: float) -> float:
+    """Upper bound for one make_session() request: every attempt may use the full timeout, plus backoff."""
+    return (SESSION_RETRIES + 1) * timeout + SESSION_BACKOFF_S * 2 ** SESSION_RETRIES
@@ -2,55 +2,130 @@
 from __future__ import annotations
 
 import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterable, List, Optional, Tuple
 
-import requests
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 import pypdf
 from docx import Document
 import io
 
+try:
+    import pdftotext  # Poppler binding; optional since it needs libpoppler-cpp installed
+except ImportError:
+    pdftotext = None
+
+from services.http_session import make_session
+
 # -----------------------------
 # Config
 # -----------------------------
 
-DEFAULT_UA = (
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-    "AppleWebKit/537.36 (KHTML, like Gecko) "
-    "Chrome/120.0 Safari/537.36"
-)
 REQUEST_TIMEOUT_S = 25
 
+# One pooled, keep-alive session for all scraping/PDF downloads: repeat hosts
+# (arxiv.org, dblp.org) skip the TCP+TLS handshake after the first request.
+_SESSION = make_session()
+# Only guards against pathological files: ordinary papers with figures often
+# exceed 10 MB. A truncated PDF is unreadable, so larger downloads are refused.
+MAX_PDF_BYTES = 50_000_000
+MAX_HTML_BYTES = 10_000_000
+_HTML_CONTENT_TYPES = ("text/html", "application/xhtml")
+
+# "pdftotext" (Poppler, C++) is several times faster than pure-Python pypdf; use it when available.
+_PDF_BACKEND = "pdftotext" if pdftotext is not None else "pypdf"
+
+# Page chrome that adds noise but no publication content
+_NOISE_SELECTORS = ("script", "style", "noscript", "svg", "header", "footer", "nav")
+
+_WS_RE = re.compile(r"\s+")
+_CRLF_RE = re.compile(r"\r\n")
+_HSPACE_RE = re.compile(r"[ \t]+")
+_MULTI_NL_RE = re.compile(r"\n{3,}")
+_ABSTRACT_HEAD_RE = re.compile(r"(?i)^abstract\b")
+_ABSTRACT_BLOCK_RE = re.compile(
+    r"(?is)\babstract\b[:\s\-]*\n?(.*?)(\n\s*(1\.?\s+introduction|introduction|keywords|index terms)\b)"
+)
+_ABSTRACT_TAIL_RE = re.compile(r"(?is)\babstract\b[:\s\-]*\n?(.*)")
+
 
 # -----------------------------
 # Internal helpers
 # -----------------------------
 
-def _http_get(url: str) -> str:
-    r = requests.get(url, timeout=REQUEST_TIMEOUT_S, headers={"User-Agent": DEFAULT_UA})
-    r.raise_for_status()
-    return r.text
+def _http_get(url: str, max_bytes: int = MAX_HTML_BYTES) -> str:
+    """
+    Fetch an HTML page, refusing non-HTML responses and bodies over max_bytes
+    before they are fully downloaded.
+    """
+    with _SESSION.get(url, stream=True, timeout=REQUEST_TIMEOUT_S) as r:
+        r.raise_for_status()
+
+        content_type = (r.headers.get("Content-Type") or "").lower()
+        if content_type and not content_type.startswith(_HTML_CONTENT_TYPES):
+            raise ValueError(f"URL did not return an HTML page (Content-Type={content_type})")
+
+        if int(r.headers.get("Content-Length") or 0) > max_bytes:
+            raise ValueError(f"Page is larger than {max_bytes} bytes")
+
+        chunks = []
+        total = 0
+        for chunk in r.iter_content(chunk_size=65536):
+            total += len(chunk)
+            if total > max_bytes:
+                raise ValueError(f"Page is larger than {max_bytes} bytes")
+            chunks.append(chunk)
+
+        return b"".join(chunks).decode(r.encoding or "utf-8", errors="replace")
+
+
+def _download_pdf_stream(url: str, max_bytes: int = MAX_PDF_BYTES, timeout: int = REQUEST_TIMEOUT_S) -> io.BytesIO:
+    """
+    Stream a PDF into memory chunk by chunk (no second full copy of the body),
+    rejecting non-PDF responses and anything larger than max_bytes.
+    """
+    with _SESSION.get(url, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+
+        content_type = (r.headers.get("Content-Type") or "").lower()
+        if "pdf" not in content_type and not url.lower().endswith(".pdf"):
+            raise ValueError(f"URL did not look like a PDF (Content-Type={content_type})")
+
+        if int(r.headers.get("Content-Length") or 0) > max_bytes:
+            raise ValueError(f"PDF is larger than {max_bytes} bytes")
+
+        buf = io.BytesIO()
+        for chunk in r.iter_content(chunk_size=65536):
+            buf.write(chunk)
+            if buf.tell() > max_bytes:
+                raise ValueError(f"PDF is larger than {max_bytes} bytes")
+
+    buf.seek(0)
+    return buf
 
 
 def _soup_text(html: str, max_chars: int = 200_000) -> str:
-    soup = BeautifulSoup(html, "lxml")
+    tree = LexborHTMLParser(html)
 
     # Remove noisy stuff
-    for tag in soup(["script", "style", "noscript", "svg"]):
-        tag.decompose()
-    for sel in ["header", "footer", "nav"]:
-        for tag in soup.select(sel):
-            tag.decompose()
-
-    text = soup.get_text(" ", strip=True)
-    text = re.sub(r"\s+", " ", text).strip()
+    for sel in _NOISE_SELECTORS:
+        for node in tree.css(sel):
+            node.decompose()
+
+    root = tree.body or tree.root
+    text = root.text(separator=" ", strip=True) if root is not None else ""
+    text = _WS_RE.sub(" ", text).strip()
     return text[:max_chars]
 
 
+def _node_text(node) -> str:
+    return node.text(separator=" ", strip=True) if node is not None else ""
+
+
 def _normalize_whitespace(text: str) -> str:
-    text = re.sub(r"\r\n", "\n", text)
-    text = re.sub(r"[ \t]+", " ", text)
-    text = re.sub(r"\n{3,}", "\n\n", text)
+    text = _CRLF_RE.sub("\n", text)
+    text = _HSPACE_RE.sub(" ", text)
+    text = _MULTI_NL_RE.sub("\n\n", text)
     return text.strip()
 
 def _extract_title_and_abstract(text: str) -> str:
@@ -71,7 +146,7 @@ def _extract_title_and_abstract(text: str) -> str:
     title = ""
     abs_idx = None
     for i, ln in enumerate(lines[:30]):
-        if re.match(r"(?i)^abstract\b", ln):
+        if _ABSTRACT_HEAD_RE.match(ln):
             abs_idx = i
             break
 
@@ -93,15 +168,12 @@ def _extract_title_and_abstract(text: str) -> str:
     joined = "\n".join(lines)
 
     # Common patterns: "Abstract", "ABSTRACT"
-    m = re.search(
-        r"(?is)\babstract\b[:\s\-]*\n?(.*?)(\n\s*(1\.?\s+introduction|introduction|keywords|index terms)\b)",
-        joined
-    )
+    m = _ABSTRACT_BLOCK_RE.search(joined)
     if m:
         summary = m.group(1).strip()
     else:
         # fallback: take ~1200 chars after 'abstract'
-        m2 = re.search(r"(?is)\babstract\b[:\s\-]*\n?(.*)", joined)
+        m2 = _ABSTRACT_TAIL_RE.search(joined)
         if m2:
             summary = m2.group(1).strip()[:1200]
         else:
@@ -109,7 +181,7 @@ def _extract_title_and_abstract(text: str) -> str:
             summary = joined[:1200]
 
     # Clean summary noise
-    summary = re.sub(r"\s+", " ", summary).strip()
+    summary = _WS_RE.sub(" ", summary).strip()
 
     out = []
     if title:
@@ -149,10 +221,23 @@ def extract_proposal_texts(uploaded_files: Optional[Iterable]) -> str:
 
 
 def _extract_pdf_text(file_obj) -> str:
-    reader = PdfReader(file_obj)
-    pages = []
-    for p in reader.pages:
-        pages.append(p.extract_text() or "")
+    # getvalue() ignores the current read position (Streamlit uploads are BytesIO-like)
+    data = file_obj.getvalue() if hasattr(file_obj, "getvalue") else file_obj.read()
+
+    if _PDF_BACKEND == "pdftotext":
+        try:
+            return "\n".join(pdftotext.PDF(io.BytesIO(data))).strip()
+        except Exception:
+            pass  # fall back to pypdf
+
+    return _extract_pdf_text_pypdf(data)
+
+
+def _extract_pdf_text_pypdf(data: bytes) -> str:
+    # Serial on purpose: extract_text is pure Python, so threads just contend
+    # for the GIL (and per-thread readers re-parse the document).
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    pages = [p.extract_text() or "" for p in reader.pages]
     return "\n".join(pages).strip()
 
 
@@ -179,8 +264,7 @@ def extract_pdf_text_from_urls(
     if not pdf_urls:
         return ""
 
-    chunks = []
-
+    urls = []
     for raw_url in pdf_urls[:max_urls]:
         url = (raw_url or "").strip()
         if not url:
@@ -189,59 +273,62 @@ def extract_pdf_text_from_urls(
         # Normalize arXiv URLs (allow missing .pdf)
         if "arxiv.org/pdf/" in url and not url.endswith(".pdf"):
             url = url + ".pdf"
+        urls.append(url)
 
-        try:
-            resp = requests.get(url, timeout=timeout)
-            resp.raise_for_status()
+    if not urls:
+        return ""
 
-            content_type = (resp.headers.get("Content-Type") or "").lower()
-            if "pdf" not in content_type and not url.lower().endswith(".pdf"):
-                # not a PDF response
-                continue
+    # Each URL is an independent download + parse; fan out and keep input order.
+    with ThreadPoolExecutor(max_workers=min(len(urls), 5)) as ex:
+        chunks = list(ex.map(
+            lambda u: _pdf_url_to_text_chunk(u, max_chars=max_chars_per_pdf, timeout=timeout),
+            urls,
+        ))
 
-            pdf_bytes = io.BytesIO(resp.content)
-            reader = pypdf.PdfReader(pdf_bytes)
+    return "\n".join(c for c in chunks if c).strip()
 
-            text_parts = []
-            total_chars = 0
 
-            # read pages until char cap
-            for page in reader.pages:
-                page_text = page.extract_text() or ""
-                page_text = page_text.strip()
-                if not page_text:
-                    continue
+def _pdf_url_to_text_chunk(url: str, max_chars: int, timeout: int) -> str:
+    """
+    Download one PDF and return its text (clipped to max_chars) with a source header,
+    or "" if the URL is not a PDF or fails.
+    """
+    try:
+        # raises on non-PDF / oversized responses -> silently skipped below
+        reader = pypdf.PdfReader(_download_pdf_stream(url, timeout=timeout))
+
+        text_parts = []
+        total_chars = 0
 
-                remaining = max_chars_per_pdf - total_chars
-                if remaining <= 0:
-                    break
+        # read pages until char cap
+        for page in reader.pages:
+            page_text = page.extract_text() or ""
+            page_text = page_text.strip()
+            if not page_text:
+                continue
 
-                page_text = page_text[:remaining]
-                text_parts.append(page_text)
-                total_chars += len(page_text)
+            remaining = max_chars - total_chars
+            if remaining <= 0:
+                break
 
-            if text_parts:
-                chunks.append(f"\n\n[PDF SOURCE: {url}]\n" + "\n".join(text_parts))
+            page_text = page_text[:remaining]
+            text_parts.append(page_text)
+            total_chars += len(page_text)
 
-        except Exception:
-            # Silent fail for now (or log if you want)
-            continue
+        if text_parts:
+            return f"\n\n[PDF SOURCE: {url}]\n" + "\n".join(text_parts)
 
-    return "\n".join(chunks).strip()
+    except Exception:
+        # Silent fail for now (or log if you want)
+        pass
+
+    return ""
 
 def _extract_text_from_single_pdf_url(url: str, max_chars: int = 4000) -> str:
     """
     Download one PDF and extract a compact block containing title + abstract/summary.
     """
-    resp = requests.get(url, timeout=30)
-    resp.raise_for_status()
-
-    content_type = resp.headers.get("Content-Type", "").lower()
-    if "pdf" not in content_type and not url.lower().endswith(".pdf"):
-        raise ValueError(f"URL did not look like a PDF (Content-Type={content_type})")
-
-    pdf_bytes = io.BytesIO(resp.content)
-    reader = PdfReader(pdf_bytes)
+    reader = pypdf.PdfReader(_download_pdf_stream(url, timeout=30))
 
     # Read first 2 pages (usually enough for title + abstract)
     text_parts = []
@@ -262,8 +349,8 @@ def _clean_pdf_text(text: str) -> str:
     text = text or ""
     # normalize whitespace
     text = text.replace("\r", "\n")
-    text = re.sub(r"[ \t]+", " ", text)
-    text = re.sub(r"\n{3,}", "\n\n", text)
+    text = _HSPACE_RE.sub(" ", text)
+    text = _MULTI_NL_RE.sub("\n\n", text)
     return text.strip()
 
 def fetch_publications_text(
@@ -324,17 +411,13 @@ def fetch_publications_text(
 
 def _fetch_dblp(url: str, max_chars: int = 200_000) -> str:
     html = _http_get(url)
-    soup = BeautifulSoup(html, "lxml")
+    tree = LexborHTMLParser(html)
 
     items = []
-    for entry in soup.select("li.entry"):
-        title = entry.select_one("span.title")
-        year = entry.select_one("span.year")
-        venue = entry.select_one("span.venue")
-
-        t = title.get_text(" ", strip=True) if title else ""
-        y = year.get_text(" ", strip=True) if year else ""
-        v = venue.get_text(" ", strip=True) if venue else ""
+    for entry in tree.css("li.entry"):
+        t = _node_text(entry.css_first("span.title"))
+        y = _node_text(entry.css_first("span.year"))
+        v = _node_text(entry.css_first("span.venue"))
         line = " | ".join([x for x in [t, v, y] if x])
         if line:
             items.append(line)
@@ -361,13 +444,11 @@ def _fetch_google_scholar_best_effort(url: str, max_chars: int = 200_000) -> Tup
             )
             return "", warnings
 
-        soup = BeautifulSoup(html, "lxml")
+        tree = LexborHTMLParser(html)
         items = []
-        for row in soup.select("tr.gsc_a_tr"):
-            title_el = row.select_one("a.gsc_a_at")
-            year_el = row.select_one("span.gsc_a_h")
-            title = title_el.get_text(" ", strip=True) if title_el else ""
-            year = year_el.get_text(" ", strip=True) if year_el else ""
+        for row in tree.css("tr.gsc_a_tr"):
+            title = _node_text(row.css_first("a.gsc_a_at"))
+            year = _node_text(row.css_first("span.gsc_a_h"))
             if title:
                 items.append(f"{title} | {year}".strip(" |"))
 
@@ -406,6 +487,50 @@ def needs_publications_fallback(pub_text: str, warnings: List[str]) -> bool:
 # 4) Extract publications from LaTeX CV (best effort)
 # -----------------------------
 
+# All LaTeX cleanup rules as one alternation so the CV is scanned once.
+# Branch order matters: specific commands must precede the generic `cmd` catch-all.
+_LATEX_RE = re.compile(
+    r"(?P<comment>^%.*$)"
+    r"|(?P<section>\\(?:section|subsection|subsubsection)\*?\{(?P<section_text>[^}]*)\})"
+    r"|(?P<textbf>\\textbf\{(?P<textbf_text>[^}]*)\})"
+    r"|(?P<emph>\\emph\{(?P<emph_text>[^}]*)\})"
+    r"|(?P<href>\\href\{[^}]*\}\{(?P<href_text>[^}]*)\})"
+    r"|(?P<url>\\url\{(?P<url_text>[^}]*)\})"
+    r"|(?P<item>\\item)"
+    r"|(?P<cite>\\cite\{[^}]*\})"
+    r"|(?P<env>\\(?:begin|end)\{[^}]+\})"
+    r"|(?P<cmd>\\[a-zA-Z]+\*?(?:\[[^\]]*\])?(?:\{[^}]*\})?)",
+    re.MULTILINE,
+)
+_BRACES_TABLE = str.maketrans("", "", "{}")
+# A `[^}]*` capture stops at the first inner `}`, so a nested \cite{key} or
+# \begin{env} inside it arrives without its closing brace. Those arguments are
+# never visible text; the brace left behind in the outer text is removed later.
+_UNCLOSED_HIDDEN_RE = re.compile(r"\\(?:cite|begin|end)\{[^}]*$")
+
+
+def _latex_inner(text: str) -> str:
+    return _LATEX_RE.sub(_latex_repl, _UNCLOSED_HIDDEN_RE.sub("", text))
+
+
+def _latex_repl(m: re.Match) -> str:
+    kind = m.lastgroup
+    if kind == "section":
+        # Keep section titles
+        return "\n" + _latex_inner(m.group("section_text")) + "\n"
+    if kind in ("textbf", "emph", "href", "url"):
+        # Preserve visible content in common formatting commands
+        return _latex_inner(m.group(f"{kind}_text"))
+    if kind == "item":
+        # Replace list items with bullets
+        return "\n- "
+    if kind == "env":
+        # begin/end environment markers become line breaks
+        return "\n"
+    # comments, cites and any remaining commands are dropped
+    return ""
+
+
 def extract_publications_from_latex(latex_text: str, max_chars: int = 200_000) -> str:
     """
     Light LaTeX -> text cleaning for publications section.
@@ -414,38 +539,13 @@ def extract_publications_from_latex(latex_text: str, max_chars: int = 200_000) -
     if not latex_text:
         return ""
 
-    t = latex_text
-
-    # Remove comments
-    t = re.sub(r"(?m)^%.*$", "", t)
-
-    # Keep section titles
-    t = re.sub(r"\\(section|subsection|subsubsection)\*?\{([^}]*)\}", r"\n\2\n", t)
-
-    # Preserve visible content in common formatting commands
-    t = re.sub(r"\\textbf\{([^}]*)\}", r"\1", t)
-    t = re.sub(r"\\emph\{([^}]*)\}", r"\1", t)
-    t = re.sub(r"\\href\{[^}]*\}\{([^}]*)\}", r"\1", t)
-    t = re.sub(r"\\url\{([^}]*)\}", r"\1", t)
-
-    # Replace list items with bullets
-    t = re.sub(r"\\item", "\n- ", t)
-
-    # Remove cite commands
-    t = re.sub(r"\\cite\{[^}]*\}", "", t)
-
-    # Remove begin/end environments markers
-    t = re.sub(r"\\begin\{[^\}]+\}", "\n", t)
-    t = re.sub(r"\\end\{[^\}]+\}", "\n", t)
-
-    # Remove remaining LaTeX commands (best effort)
-    t = re.sub(r"\\[a-zA-Z]+\*?(?:\[[^\]]*\])?(?:\{[^}]*\})?", "", t)
+    t = _LATEX_RE.sub(_latex_repl, latex_text)
 
     # Remove braces
-    t = t.replace("{", "").replace("}", "")
+    t = t.translate(_BRACES_TABLE)
 
     # Normalize whitespace
-    t = re.sub(r"\s+", " ", t).strip()
+    t = _WS_RE.sub(" ", t).strip()
     t = t.replace(" - ", "\n- ")
 
     return _normalize_whitespace(t)[:max_chars]
@@ -0,0 +1,42 @@
+# services/keywords.py
+from __future__ import annotations
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Tuple
+
+try:
+    import ahocorasick  # pyahocorasick: finds every keyword in one pass over a text
+except ImportError:
+    ahocorasick = None
+
+# Keyword-in-text matching shared by the profile recency weights and the ranking
+# recency bonus. Semantics are plain substring ("kw in text"), but one scan of
+# the text finds every keyword instead of one `in` check per keyword.
+
+
+@lru_cache(maxsize=64)
+def keyword_matcher(keywords: Tuple[str, ...]) -> Callable[[str], Dict[str, None]]:
+    """
+    Build (once per keyword tuple) a find(text) function for lowered keywords.
+    find() expects lowered text and returns the keywords occurring in it, each
+    once, as an insertion-ordered dict.
+    """
+    kws = [k for k in dict.fromkeys(keywords) if k]
+    if not kws:
+        return lambda text: {}
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for kw in kws:
+            automaton.add_word(kw, kw)
+        automaton.make_automaton()
+        return lambda text: dict.fromkeys(kw for _, kw in automaton.iter(text))
+
+    # Without pyahocorasick: one compiled regex union. Longest alternative first,
+    # inside a lookahead so matches may overlap ("graph" and "graph neural" both
+    # count in "graph neural networks"). A hit at a position also implies every
+    # keyword that is a prefix of it.
+    by_len = sorted(kws, key=len, reverse=True)
+    pattern = re.compile("(?=(" + "|".join(re.escape(k) for k in by_len) + "))")
+    prefixes = {k: [p for p in by_len if k.startswith(p)] for k in by_len}
+    return lambda text: dict.fromkeys(p for m in pattern.finditer(text) for p in prefixes[m.group(1)])
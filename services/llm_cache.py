@@ -0,0 +1,77 @@
+# services/llm_cache.py
+from __future__ import annotations
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+# Content-addressed, in-process cache for LLM results. Streamlit reruns the whole
+# script on every widget click, so identical prompts (same profile, same calls)
+# come back constantly; this answers them without another Gemini round trip.
+# Entries live for the server process and are shared across sessions.
+
+MAX_ENTRIES = 2048
+
+_lock = threading.Lock()
+_entries: "OrderedDict[str, Any]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0}
+
+
+def make_key(*parts: Any) -> str:
+    """sha256 over the str() of each part, e.g. make_key(model, prompt, temperature)."""
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(str(p).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def cache_get(key: str) -> Optional[Any]:
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return _entries[key]
+        _stats["misses"] += 1
+        return None
+
+
+def cache_put(key: str, value: Any) -> None:
+    with _lock:
+        _entries[key] = value
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def cache_stats() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, "entries": len(_entries)}
+
+
+def cached_llm_call(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Cache fn's result keyed on all of its arguments (defaults applied, so
+    positional and keyword calls share entries). Empty results are not cached,
+    so a blank model response is retried next time instead of sticking.
+    """
+    sig = inspect.signature(fn)
+
+    @wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        bound = sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = make_key(fn.__qualname__, *(f"{k}={v!r}" for k, v in bound.arguments.items()))
+
+        hit = cache_get(key)
+        if hit is not None:
+            return hit
+
+        result = fn(*args, **kwargs)
+        if result:
+            cache_put(key, result)
+        return result
+
+    return wrapper
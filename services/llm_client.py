@@ -1,8 +1,16 @@
 # services/llm_client.py
-import os, json, time
-from typing import Any, Optional
+import os
+import random
+import time
+from typing import Any, Callable, Optional, Tuple, TypeVar
+import orjson
 import streamlit as st
 from google import genai
+from google.genai import errors as genai_errors
+
+from services.llm_cache import cache_get, cache_put, cached_llm_call, make_key
+
+T = TypeVar("T")
 
 def _get_api_key() -> str:
     # Prefer Streamlit secrets
@@ -13,66 +21,184 @@ def _get_api_key() -> str:
     # Fallback to env
     return os.environ.get("GOOGLE_API_KEY") or os.environ.get("GEMINI_API_KEY") or ""
 
-key = _get_api_key()
+# Built on first LLM call rather than at import, so UI-only reruns (and a
+# missing API key) don't pay for / fail on client construction. cache_resource
+# keeps the one client (and its pooled connections) across reruns, sessions and
+# module hot-reloads.
+@st.cache_resource(show_spinner=False)
+def _get_client() -> genai.Client:
+    key = _get_api_key()
 
-# Set ONLY ONE env var to avoid the warning
-if key:
-    os.environ["GOOGLE_API_KEY"] = key
-    os.environ.pop("GEMINI_API_KEY", None)  # optional: remove if it exists
+    # Set ONLY ONE env var to avoid the warning
+    if key:
+        os.environ["GOOGLE_API_KEY"] = key
+        os.environ.pop("GEMINI_API_KEY", None)  # optional: remove if it exists
 
-_client = genai.Client(api_key=key)
+    return genai.Client(api_key=key)
 
 DEFAULT_MODEL = "gemini-2.5-flash"
 
-def llm_text(prompt: str, model: str = DEFAULT_MODEL, temperature: float = 0.4) -> str:
-    resp = _client.models.generate_content(
-        model=model,
-        contents=prompt,
-        # Best-effort generation config; supported by Gemini API
-        config={"temperature": temperature},
-    )
-    return (resp.text or "").strip()
-
-def llm_json(prompt: str, model: str = DEFAULT_MODEL, temperature: float = 0.3,
-             max_retries: int = 2, sleep_s: float = 0.8) -> Any:
-    json_prompt = prompt.strip() + "\n\nReturn ONLY valid JSON. No markdown fences."
-    last_err: Optional[Exception] = None
-    last_text: str = ""
+# Two separate retry budgets:
+# - API: rate limits (429) and transient server errors are retried with
+#   exponential backoff + jitter; anything else (bad key, bad request) fails
+#   immediately.
+# - Parse: output that isn't valid JSON gets a repair request right away, at
+#   temperature 0 and without sleeping (the API itself is fine).
+LLM_MAX_API_RETRIES = 2
+LLM_MAX_PARSE_RETRIES = 2
+LLM_BACKOFF_BASE_S = 1.0
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 
-    for i in range(max_retries + 1):
-        text = llm_text(json_prompt, model=model, temperature=temperature)
-        last_text = (text or "").strip()
+def _generation_config(temperature: float, json_mode: bool) -> dict:
+    # Best-effort generation config; supported by Gemini API
+    config: dict = {"temperature": temperature}
+    if json_mode:
+        # structured output: the model emits a bare, syntactically valid JSON document
+        config["response_mime_type"] = "application/json"
+    return config
 
-        # Quick guard: empty output
-        if not last_text:
-            last_err = ValueError("Empty model output")
-            time.sleep(sleep_s)
-            continue
+def _with_backoff(fn: Callable[[], T]) -> T:
+    for attempt in range(LLM_MAX_API_RETRIES + 1):
+        try:
+            return fn()
+        except genai_errors.APIError as e:
+            if e.code not in _RETRYABLE_STATUS or attempt == LLM_MAX_API_RETRIES:
+                raise
+            time.sleep(LLM_BACKOFF_BASE_S * (2 ** attempt) + random.uniform(0, 0.2))
 
-        # If model wrapped JSON in ``` ... ```, strip it (common)
-        if last_text.startswith("```"):
-            last_text = last_text.strip("`")
-            last_text = last_text.replace("json", "", 1).strip()
+def _generate_text(prompt: str, model: str, temperature: float, json_mode: bool) -> str:
+    config = _generation_config(temperature, json_mode)
 
-        try:
-            return json.loads(last_text)
-        except Exception as e:
-            last_err = e
-            # One more attempt: ask model to repair to JSON
-            if i < max_retries:
-                repair_prompt = (
-                    "Fix the following to be valid JSON ONLY. "
-                    "Do not add extra keys. Return only JSON.\n\n"
-                    f"{last_text[:4000]}"
-                )
-                repaired = llm_text(repair_prompt, model=model, temperature=0.0).strip()
-                try:
-                    return json.loads(repaired)
-                except Exception:
-                    pass
-            time.sleep(sleep_s)
+    def call() -> str:
+        resp = _get_client().models.generate_content(
+            model=model,
+            contents=prompt,
+            config=config,
+        )
+        return (resp.text or "").strip()
+
+    return _with_backoff(call)
+
+# Identical (prompt, model, temperature, json_mode) requests are answered from
+# services/llm_cache. The JSON helpers below don't go through here: they cache
+# only output that actually parsed.
+@cached_llm_call
+def llm_text(prompt: str, model: str = DEFAULT_MODEL, temperature: float = 0.4,
+             json_mode: bool = False) -> str:
+    return _generate_text(prompt, model, temperature, json_mode)
+
+def _trim_to_json(text: str) -> str:
+    """
+    Slice from the first opening brace/bracket to its last closer, which drops
+    ```json fences and any prose the model put around the document.
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return text
+    start = min(starts)
+    end = text.rfind("}" if text[start] == "{" else "]")
+    return text[start:end + 1] if end > start else text
+
+def _json_prompt(prompt: str) -> str:
+    return prompt.strip() + "\n\nReturn ONLY valid JSON. No markdown fences."
+
+def _parse_json(last_text: str, model: str, resend: Callable[[], str]) -> Any:
+    """
+    Parse model output as JSON, using up to LLM_MAX_PARSE_RETRIES follow-up
+    requests: blank output re-sends the original prompt (resend), invalid JSON
+    gets a repair request.
+    """
+    # Fenced / chatty output is trimmed locally instead of costing a repair call
+    text = _trim_to_json(last_text)
+    first_text = ""  # first non-blank output, for the error snippet
+    last_err: Optional[Exception] = None
+    for attempt in range(LLM_MAX_PARSE_RETRIES + 1):
+        if not text:
+            last_err = RuntimeError("Empty model output")
+        else:
+            first_text = first_text or text
+            try:
+                return orjson.loads(text)
+            except orjson.JSONDecodeError as e:
+                last_err = e
+        if attempt == LLM_MAX_PARSE_RETRIES:
+            break
+
+        if not text:
+            # Gemini returns no text when thinking uses up the output budget or the
+            # response is blocked; asking again usually works
+            text = _trim_to_json(resend())
+            continue
+
+        # Fallback: ask model to repair to JSON. Uncached: a repeated bad answer
+        # yields the same repair prompt, and each retry must reach the model.
+        repair_prompt = (
+            "Fix the following to be valid JSON ONLY. "
+            "Do not add extra keys. Return only JSON.\n\n"
+            f"{text[:4000]}"
+        )
+        text = _trim_to_json(_generate_text(repair_prompt, model, 0.0, json_mode=True))
 
     # Include a snippet so you can see what the model produced
-    snippet = last_text[:800].replace("\n", "\\n")
+    snippet = first_text[:800].replace("\n", "\\n")
     raise RuntimeError(f"Failed to parse JSON. Last error: {last_err}. Model output snippet: {snippet}")
 
+def llm_json(prompt: str, model: str = DEFAULT_MODEL, temperature: float = 0.3) -> Any:
+    json_prompt = _json_prompt(prompt)
+
+    # Only a parsed result is cached (re-serialized, so callers always get a fresh
+    # object); unparseable output is asked for again next time, not replayed.
+    key = make_key("llm_json", model, json_prompt, temperature)
+    hit = cache_get(key)
+    if hit is not None:
+        return orjson.loads(hit)
+
+    # JSON mode makes one call enough on the happy path; API errors are retried
+    # (with backoff), parse errors go straight to a repair call.
+    def generate() -> str:
+        return _generate_text(json_prompt, model, temperature, json_mode=True)
+
+    parsed = _parse_json(generate(), model, resend=generate)
+    cache_put(key, orjson.dumps(parsed))
+    return parsed
+
+def _stream_json_text(prompt: str, model: str, config: dict) -> Tuple[str, Any]:
+    """
+    Read a streamed response, trying to parse whenever the buffer ends in a
+    closing brace/bracket. Returns (text, parsed); parsed is None if the stream
+    ended without a complete document.
+    """
+    buf = ""
+    stream = _get_client().models.generate_content_stream(model=model, contents=prompt, config=config)
+    for chunk in stream:
+        buf += chunk.text or ""
+        if not buf.rstrip().endswith(("}", "]")):
+            continue
+        try:
+            return buf.strip(), orjson.loads(_trim_to_json(buf.strip()))
+        except orjson.JSONDecodeError:
+            continue  # closer of a nested object; keep reading
+    return buf.strip(), None
+
+def llm_json_stream(prompt: str, model: str = DEFAULT_MODEL, temperature: float = 0.3) -> Any:
+    """
+    llm_json over generate_content_stream: parsing overlaps the download and
+    returns as soon as a complete JSON document has arrived. Output that never
+    parses goes through the same trim/repair path as llm_json.
+    """
+    json_prompt = _json_prompt(prompt)
+
+    # Cached like llm_json: only a parsed result, re-serialized
+    key = make_key("llm_json_stream", model, json_prompt, temperature)
+    hit = cache_get(key)
+    if hit is not None:
+        return orjson.loads(hit)
+
+    config = _generation_config(temperature, json_mode=True)
+    text, parsed = _with_backoff(lambda: _stream_json_text(json_prompt, model, config))
+    if parsed is None:
+        parsed = _parse_json(
+            text, model, resend=lambda: _generate_text(json_prompt, model, temperature, json_mode=True)
+        )
+    cache_put(key, orjson.dumps(parsed))
+    return parsed
@@ -1,62 +1,111 @@
 # services/match.py
 from __future__ import annotations
-from typing import Any, Dict, List
-import re
-
-from services.llm_client import llm_json, llm_text
-
-def _normalize_tokens(text: str) -> set[str]:
-    text = (text or "").lower()
-    text = re.sub(r"[^a-z0-9\s\-]", " ", text)
-    toks = set(t for t in text.split() if len(t) >= 3)
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Tuple
+import os
+
+from services.keywords import keyword_matcher
+from services.llm_cache import cache_get, cache_put, make_key
+from services.llm_client import llm_json_stream, llm_text
+
+# Max ranking requests in flight at once (keeps us under Gemini rate limits).
+RANK_MAX_CONCURRENCY = 8
+
+# Calls per ranking request: small enough to stay fast and parse reliably,
+# large enough to amortize the shared profile/instructions across calls.
+RANK_BATCH_SIZE = max(1, int(os.environ.get("GRANTMATCH_RANK_BATCH_SIZE", "6")))
+
+# Only the calls with the best keyword-overlap prior are sent to the LLM; the rest
+# keep their (cheap) fallback score instead of costing tokens.
+RANK_PREFILTER_TOP_M = max(1, int(os.environ.get("GRANTMATCH_RANK_PREFILTER_TOP_M", "20")))
+
+class _TokenCharTable(dict):
+    """
+    str.translate table for _normalize_tokens: a-z, 0-9, "-" and whitespace map
+    to themselves, every other char to a space. Filled lazily, so non-ASCII text
+    costs one lookup per distinct char rather than a table of all code points.
+    """
+    def __missing__(self, cp: int) -> int:
+        ch = chr(cp)
+        keep = "a" <= ch <= "z" or "0" <= ch <= "9" or ch == "-" or ch.isspace()
+        self[cp] = cp if keep else 0x20
+        return self[cp]
+
+_TOK_TABLE = _TokenCharTable()
+
+# Reruns re-score the same profile/call blobs; memoized per text. Returns a
+# frozenset so the cached value can't be mutated by a caller.
+@lru_cache(maxsize=1024)
+def _normalize_tokens(text: str) -> frozenset[str]:
+    text = (text or "").lower().translate(_TOK_TABLE)
+    toks = frozenset(t for t in text.split() if len(t) >= 3)
     return toks
 
-def _recency_overlap_bonus(profile: dict, call_item: dict, cap: float = 20.0, scale: float = 6.0) -> float:
-    recency = (profile or {}).get("keyword_recency_weights", {}) or {}
-    if not isinstance(recency, dict) or not recency:
-        return 0.0
-
-    call_text = " ".join([
+@lru_cache(maxsize=32)
+def _recency_index(items: Tuple[Tuple[Any, Any], ...]) -> Tuple[Callable[[str], Dict[str, None]], Dict[str, float]]:
+    # One matcher per recency dict, shared by every call scored against it
+    weights: Dict[str, float] = {}
+    for kw, w in items:
+        if kw:
+            kw_l = str(kw).lower()
+            weights[kw_l] = weights.get(kw_l, 0.0) + float(w)
+    return keyword_matcher(tuple(weights)), weights
+
+def _call_text(call_item: dict) -> str:
+    # lowered title/summary/agency: what recency keywords are matched against
+    return " ".join([
         str(call_item.get("title", "")),
         str(call_item.get("summary", "")),
         str(call_item.get("agency", "")),
     ]).lower()
 
-    bonus = 0.0
-    for kw, w in recency.items():
-        if kw and str(kw).lower() in call_text:
-            bonus += float(w)
+def _recency_overlap_bonus(profile: dict, call_item: dict, cap: float = 20.0, scale: float = 6.0,
+                           call_text: str | None = None) -> float:
+    recency = (profile or {}).get("keyword_recency_weights", {}) or {}
+    if not isinstance(recency, dict) or not recency:
+        return 0.0
+
+    # rank_calls scores each call more than once and passes its _call_text in
+    if call_text is None:
+        call_text = _call_text(call_item)
+
+    find_keywords, weights = _recency_index(tuple(recency.items()))
+    bonus = sum(weights[kw_l] for kw_l in find_keywords(call_text))
 
     return min(cap, bonus * scale)
 
-def _fallback_score(profile: Dict[str, Any], call: Dict[str, Any]) -> Dict[str, Any]:
+def _profile_tokens(profile: Dict[str, Any]) -> frozenset[str]:
     methods = profile.get("methods_keywords", []) or []
     themes  = profile.get("themes", []) or []
-    prof_blob = " ".join(methods + themes)
-
-    call_blob = " ".join([
-        str(call.get("agency", "")),
-        str(call.get("title", "")),
-        str(call.get("summary", "")),
-        str(call.get("deadline", "")),
-    ])
-
-    A = _normalize_tokens(prof_blob)
-    B = _normalize_tokens(call_blob)
+    return _normalize_tokens(" ".join(methods + themes))
+
+def _fallback_score(profile: Dict[str, Any], call: Dict[str, Any],
+                    prof_tokens: frozenset[str] | None = None,
+                    call_text: str | None = None) -> Dict[str, Any]:
+    # callers scoring many calls pass prof_tokens so the profile is tokenized once
+    A = prof_tokens if prof_tokens is not None else _profile_tokens(profile)
+    if call_text is None:
+        call_text = _call_text(call)
+
+    # same token set as agency/title/summary/deadline joined, minus a second lower()
+    B = _normalize_tokens(f"{call_text} {call.get('deadline', '')}")
+    hits = A.intersection(B)
     if not A or not B:
         base_score = 5
     else:
-        overlap = len(A & B)
+        overlap = len(hits)
         # scale overlap -> 0..100 but not all zeros
         base_score = min(100, 10 + overlap * 6)
 
     # ✅ recency bonus
-    recency_bonus = _recency_overlap_bonus(profile, call, cap=20, scale=6)
+    recency_bonus = _recency_overlap_bonus(profile, call, cap=20, scale=6, call_text=call_text)
 
     score = int(max(0, min(100, round(base_score + recency_bonus))))
 
     why = []
-    top_hits = list((A & B))[:10]
+    top_hits = list(hits)[:10]
     if top_hits:
         why.append(f"Keyword overlap: {', '.join(top_hits[:8])}")
     if recency_bonus > 0:
@@ -68,11 +117,63 @@ def _fallback_score(profile: Dict[str, Any], call: Dict[str, Any]) -> Dict[str,
         "Propose 2–3 aims, identify datasets/testbeds, and highlight prior results."
     )
 
-    out = dict(call)
-    out["fit_score"] = score
-    out["why_fit"] = why
-    out["recommended_pitch"] = pitch
-    out["rank_mode"] = "fallback"
+    return {**call, "fit_score": score, "why_fit": why, "recommended_pitch": pitch, "rank_mode": "fallback"}
+
+def _rank_prompt(compact_profile: Dict[str, Any], compact_calls: List[Dict[str, Any]], attempt_id: int = 0) -> str:
+    prompt = f"""
+You are ranking funding calls for research fit.
+
+Return ONLY valid JSON (no markdown, no extra text) with this exact schema:
+{{
+  "ranked": [
+    {{
+      "idx": 0,
+      "fit_score": 0,
+      "why_fit": ["...","..."],
+      "recommended_pitch": "..."
+    }}
+  ]
+}}
+
+Rules:
+- fit_score is an integer 0..100 (higher is better).
+- idx must match an input call idx.
+- ONLY include calls with fit_score >= 50.
+- why_fit must be a short list of 2-5 bullets.
+- If none qualify, return: {{"ranked": []}}
+
+Professor profile:
+{compact_profile}
+
+Calls:
+{compact_calls}
+""".strip()
+
+    if attempt_id:
+        # LLM responses are cached by prompt; make "Rerank" ask for a fresh ranking
+        prompt += f"\n\n(Re-ranking attempt #{attempt_id}.)"
+    return prompt
+
+def _rank_batch(compact_profile: Dict[str, Any], batch: List[Dict[str, Any]], attempt_id: int = 0) -> List[Dict[str, Any]]:
+    """
+    Rank one batch of compact calls with the LLM. The batch is sent with local idx
+    0..n-1 (what the model sees); returned items carry the caller's idx again.
+    """
+    local_calls = [{**c, "idx": j} for j, c in enumerate(batch)]
+    # streamed: the ranking is parsed as soon as its closing brace arrives
+    data = llm_json_stream(_rank_prompt(compact_profile, local_calls, attempt_id))
+    ranked = data.get("ranked") if isinstance(data, dict) else None
+    if not isinstance(ranked, list):
+        raise RuntimeError("LLM returned invalid ranked list format.")
+
+    out = []
+    for item in ranked:
+        if not isinstance(item, dict):
+            continue
+        j = item.get("idx")
+        if not isinstance(j, int) or j < 0 or j >= len(batch):
+            continue
+        out.append({**item, "idx": batch[j]["idx"]})
     return out
 
 def rank_calls(profile: Dict[str, Any], calls: List[Dict[str, Any]], attempt_id: int = 0) -> List[Dict[str, Any]]:
@@ -103,76 +204,113 @@ def rank_calls(profile: Dict[str, Any], calls: List[Dict[str, Any]], attempt_id:
             "source": c.get("source", ""),
         })
 
-    prompt = f"""
-You are ranking funding calls for research fit.
-
-Return ONLY valid JSON (no markdown, no extra text) with this exact schema:
-{{
-  "ranked": [
-    {{
-      "idx": 0,
-      "fit_score": 0,
-      "why_fit": ["...","..."],
-      "recommended_pitch": "..."
-    }}
-  ]
-}}
-
-Rules:
-- fit_score is an integer 0..100 (higher is better).
-- idx must match an input call idx.
-- ONLY include calls with fit_score >= 50.
-- why_fit must be a short list of 2-5 bullets.
-- If none qualify, return: {{"ranked": []}}
-
-Professor profile:
-{compact_profile}
-
-Calls:
-{compact_calls}
-""".strip()
+    # Keyword prefilter: score every call with the fallback matcher (pure Python,
+    # no LLM) and only send the top RANK_PREFILTER_TOP_M on for LLM ranking.
+    prof_tokens = _profile_tokens(profile)
+    call_texts = {c["idx"]: _call_text(calls[c["idx"]]) for c in compact_calls}
+    prelim = {
+        c["idx"]: _fallback_score(profile, calls[c["idx"]], prof_tokens, call_texts[c["idx"]])
+        for c in compact_calls
+    }
+    top = sorted(compact_calls, key=lambda c: prelim[c["idx"]]["fit_score"], reverse=True)[:RANK_PREFILTER_TOP_M]
+    keep = {c["idx"] for c in top}
+    llm_calls = [c for c in compact_calls if c["idx"] in keep]
+
+    # Per-call result cache keyed on (profile, call, attempt): reruns - or a refresh
+    # that adds a few new calls - only send the calls not scored before.
+    profile_key = make_key(compact_profile)
+    call_keys = {
+        c["idx"]: make_key("rank_call", profile_key, {k: v for k, v in c.items() if k != "idx"}, attempt_id)
+        for c in llm_calls
+    }
 
     try:
-        data = llm_json(prompt)
-        ranked = data.get("ranked") if isinstance(data, dict) else None
-        if not isinstance(ranked, list):
-            raise RuntimeError("LLM returned invalid ranked list format.")
+        ranked: List[Dict[str, Any]] = []
+        todo: List[Dict[str, Any]] = []
+        for c in llm_calls:
+            hit = cache_get(call_keys[c["idx"]])
+            if hit is None:
+                todo.append(c)
+            elif hit:  # {} = judged below threshold (omitted by the LLM)
+                ranked.append({**hit, "idx": c["idx"]})
+
+        # Several small requests instead of one huge prompt: the requests overlap
+        # their network/model latency, and a bad response only affects its own batch.
+        batches = [todo[i:i + RANK_BATCH_SIZE] for i in range(0, len(todo), RANK_BATCH_SIZE)]
+
+        failed: List[Tuple[List[Dict[str, Any]], Exception]] = []
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(len(batches), RANK_MAX_CONCURRENCY)) as ex:
+                futures = [ex.submit(_rank_batch, compact_profile, b, attempt_id) for b in batches]
+                for batch, fut in zip(batches, futures):
+                    try:
+                        batch_ranked = fut.result()
+                    except Exception as e:
+                        failed.append((batch, e))
+                        continue
+                    ranked.extend(batch_ranked)
+
+                    by_idx = {item["idx"]: item for item in batch_ranked}
+                    for c in batch:
+                        item = by_idx.get(c["idx"])
+                        cache_put(call_keys[c["idx"]], {k: v for k, v in item.items() if k != "idx"} if item else {})
+
+        # No call got an LLM judgement (fresh or cached): use the whole-list fallback
+        if failed and sum(len(b) for b, _ in failed) == len(llm_calls):
+            raise failed[0][1]
 
         # Validate + merge back into original calls
         out = []
         for item in ranked:
-            if not isinstance(item, dict): 
-                continue
-            idx = item.get("idx")
-            if not isinstance(idx, int) or idx < 0 or idx >= len(calls):
-                continue
+            idx = item["idx"]
 
-            merged = dict(calls[idx])
             base_llm_score = int(item.get("fit_score", 0) or 0)
-            recency_bonus = _recency_overlap_bonus(profile, calls[idx], cap=10, scale=6)
+            recency_bonus = _recency_overlap_bonus(profile, calls[idx], cap=10, scale=6, call_text=call_texts[idx])
 
             final_score = int(max(0, min(100, round(base_llm_score + recency_bonus))))
 
-            merged["fit_score"] = final_score
-            merged["why_fit"] = item.get("why_fit", []) or []
+            why_fit = item.get("why_fit", []) or []
             if recency_bonus > 0:
-                merged["why_fit"] = [f"Recent-publication bonus applied (+{recency_bonus:.1f})"] + merged["why_fit"]
-            merged["recommended_pitch"] = item.get("recommended_pitch", "")
-            merged["rank_mode"] = "llm"
-            out.append(merged)
+                why_fit = [f"Recent-publication bonus applied (+{recency_bonus:.1f})"] + why_fit
+            out.append({
+                **calls[idx],
+                "fit_score": final_score,
+                "why_fit": why_fit,
+                "recommended_pitch": item.get("recommended_pitch", ""),
+                "rank_mode": "llm",
+            })
 
         # If LLM gave nothing usable, fallback
-        if not out:
+        if not out and not failed:
             raise RuntimeError("LLM ranked list could not be merged.")
 
-        # Sort by score desc
-        out.sort(key=lambda x: x.get("fit_score", 0), reverse=True)
-        out = [x for x in out if int(x.get("fit_score", 0) or 0) >= 50]
+        # Calls cut by the prefilter compete on their fallback score
+        for c in compact_calls:
+            if c["idx"] not in keep:
+                item = prelim[c["idx"]]
+                out.append({
+                    **item,
+                    "why_fit": item["why_fit"][:-1] + ["Below the keyword prefilter cutoff; not sent to the LLM."],
+                    "rank_mode": "fallback-prefilter",
+                })
+
+        # Calls whose request failed were never judged by the LLM: same, with the error noted
+        for batch, err in failed:
+            for c in batch:
+                item = prelim[c["idx"]]
+                out.append({**item, "why_fit": [f"LLM ranking failed for this call: {err}"] + item["why_fit"]})
+
+        # Keep scores >= 50, best first (one filtered pass feeding the heap)
+        out = heapq.nlargest(
+            len(out),
+            (x for x in out if int(x.get("fit_score", 0) or 0) >= 50),
+            key=lambda x: x["fit_score"],
+        )
         return out
 
     except Exception as e:
         # Fallback scoring so user still gets something meaningful
-        scored = [_fallback_score(profile, c) for c in calls]
+        scored = [_fallback_score(profile, c, prof_tokens) for c in calls]
         scored.sort(key=lambda x: x.get("fit_score", 0), reverse=True)
 
         # add error info on the first item (help debugging in UI)
@@ -1,25 +1,47 @@
 # services/profile.py
+from concurrent.futures import ThreadPoolExecutor
+from services.keywords import keyword_matcher
 from services.llm_client import llm_json
 import re
 import math
-from collections import defaultdict
+from collections import Counter, defaultdict
 from datetime import datetime
 
-def build_prof_profile(pubs_text: str, proposals_text: str) -> dict:
-    pubs = (pubs_text or "")[:12000]      # keep prompt manageable
-    props = (proposals_text or "")[:8000] # proposals may be empty; that's ok
+import numpy as np
 
-    prompt = f"""
-You are extracting a research profile for a professor for grant matching.
+# Long publication lists are profiled map-reduce style: each ~3k-char chunk is
+# summarized by its own (short, concurrent) request, then one reducer request
+# merges the partial lists. Shorter text goes straight to the single prompt.
+# The chunk cap (~120k chars) only guards API quota; anything past it is
+# reported in profile["publications_truncated"].
+PROFILE_CHUNK_CHARS = 3000
+PROFILE_MAX_CHUNKS = 40
+PROFILE_MAX_CONCURRENCY = 4
 
-Return ONLY valid JSON with EXACT keys:
-{{
+_PROFILE_SCHEMA = """{
   "themes": [string],
   "methods_keywords": [string],
   "application_domains": [string],
   "strongest_prior_results": [string],
-  "agencies_fit": [{{"agency": string, "why": string}}]
-}}
+  "agencies_fit": [{"agency": string, "why": string}]
+}"""
+
+_YEAR_RE = re.compile(r"\b(19\d{2}|20\d{2})\b")
+
+_PARTIAL_KEYS = ("themes", "methods_keywords", "application_domains", "strongest_prior_results")
+
+def build_prof_profile(pubs_text: str, proposals_text: str) -> dict:
+    props = (proposals_text or "")[:8000] # proposals may be empty; that's ok
+
+    all_chunks = _chunk_text(pubs_text or "", PROFILE_CHUNK_CHARS)
+    chunks, dropped = all_chunks[:PROFILE_MAX_CHUNKS], all_chunks[PROFILE_MAX_CHUNKS:]
+    if len(chunks) <= 1:
+        pubs = chunks[0] if chunks else ""
+        prompt = f"""
+You are extracting a research profile for a professor for grant matching.
+
+Return ONLY valid JSON with EXACT keys:
+{_PROFILE_SCHEMA}
 
 Rules:
 - Output must be valid JSON and nothing else.
@@ -32,7 +54,28 @@ Publications (raw text):
 Prior proposals (raw text):
 {props}
 """
-    profile = llm_json(prompt)  # or whatever your current line is
+        profile = llm_json(prompt)
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(chunks), PROFILE_MAX_CONCURRENCY)) as ex:
+            futures = [ex.submit(_extract_partial_profile, c) for c in chunks]
+
+        partials = []
+        last_err: Exception | None = None
+        for fut in futures:
+            try:
+                part = fut.result()
+            except Exception as e:
+                last_err = e  # one bad chunk shouldn't sink the whole profile
+                continue
+            if isinstance(part, dict):
+                partials.append(part)
+
+        if not partials:
+            # surface the real cause (bad API key, quota, ...), not just the symptom
+            raise RuntimeError(
+                f"Profile extraction failed for every publications chunk. Last error: {last_err}"
+            ) from last_err
+        profile = _reduce_partial_profiles(partials, props)
 
     # Ensure dict
     if not isinstance(profile, dict):
@@ -42,6 +85,12 @@ Prior proposals (raw text):
     if not isinstance(methods, list):
         methods = []
 
+    if dropped:
+        profile["publications_truncated"] = {
+            "used_chars": sum(len(c) for c in chunks),
+            "dropped_chars": sum(len(c) for c in dropped),
+        }
+
     profile["keyword_recency_weights"] = _build_keyword_recency_weights(
         pub_text=pubs_text,
         methods_keywords=methods,
@@ -51,13 +100,88 @@ Prior proposals (raw text):
     return profile
 
 
+def _chunk_text(text: str, max_chars: int) -> list[str]:
+    """Split text into chunks of at most ~max_chars, breaking between lines."""
+    chunks, cur, cur_len = [], [], 0
+    for line in text.splitlines():
+        # a single over-long line (e.g. PDF text without breaks) is cut into pieces
+        for piece in (line[i:i + max_chars] for i in range(0, max(len(line), 1), max_chars)):
+            if cur and cur_len + len(piece) > max_chars:
+                chunks.append("\n".join(cur))
+                cur, cur_len = [], 0
+            cur.append(piece)
+            cur_len += len(piece) + 1
+    if cur:
+        chunks.append("\n".join(cur))
+    return [c for c in chunks if c.strip()]
+
+def _extract_partial_profile(chunk: str) -> dict | None:
+    """Map step: themes/methods/domains/results from one publications chunk."""
+    prompt = f"""
+You are extracting research profile signals for a professor from PART of their publication list.
+
+Return ONLY valid JSON with EXACT keys:
+{{
+  "themes": [string],
+  "methods_keywords": [string],
+  "application_domains": [string],
+  "strongest_prior_results": [string]
+}}
+
+Rules:
+- Output must be valid JSON and nothing else.
+- Only use what this excerpt supports; short phrases, no commentary.
+
+Publications excerpt (raw text):
+{chunk}
+"""
+    data = llm_json(prompt)
+    return data if isinstance(data, dict) else None
+
+def _reduce_partial_profiles(partials: list[dict], props: str) -> dict:
+    """Reduce step: count-merge the partial lists, then one small canonicalizing call."""
+    merged = {}
+    for key in _PARTIAL_KEYS:
+        counts = Counter()
+        spelling = {}
+        for part in partials:
+            items = part.get(key, [])
+            if not isinstance(items, list):
+                continue
+            for item in dict.fromkeys(str(x).strip() for x in items if str(x).strip()):
+                counts[item.lower()] += 1
+                spelling.setdefault(item.lower(), item)
+        # most frequent across chunks first
+        merged[key] = [spelling[k] for k, _ in counts.most_common(60)]
+
+    prompt = f"""
+You are merging partial research profiles (extracted from separate chunks of one
+professor's publication list) into one profile for grant matching.
+
+Return ONLY valid JSON with EXACT keys:
+{_PROFILE_SCHEMA}
+
+Rules:
+- Output must be valid JSON and nothing else.
+- No markdown, no code fences, no commentary.
+- Merge duplicates/synonyms; candidates are ordered by how many chunks mention them.
+- Use 5-10 themes, 20-40 methods_keywords, 5-10 application_domains.
+
+Candidate lists (from publications):
+{merged}
+
+Prior proposals (raw text):
+{props}
+"""
+    return llm_json(prompt)
+
 def _split_pub_lines(pub_text: str) -> list[str]:
     # Keep non-empty lines only
     return [ln.strip() for ln in (pub_text or "").splitlines() if ln.strip()]
 
 def _extract_year_from_line(line: str) -> int | None:
     # Match 19xx or 20xx
-    m = re.search(r"\b(19\d{2}|20\d{2})\b", line)
+    m = _YEAR_RE.search(line)
     if not m:
         return None
     y = int(m.group(1))
@@ -65,17 +189,17 @@ def _extract_year_from_line(line: str) -> int | None:
         return y
     return None
 
-def _year_weight(year: int | None, current_year: int = 2026, half_life_years: float = 5.0) -> float:
+def _year_weights(years: np.ndarray, current_year: int = 2026, half_life_years: float = 5.0) -> np.ndarray:
     """
-    Exponential decay:
+    Exponential decay, per line (year 0 = no year found):
       current_year => ~1.0
       5 years old => ~0.5
       10 years old => ~0.25
     """
-    if year is None:
-        return 0.25  # unknown year gets small but nonzero weight
-    age = max(0, current_year - year)
-    return 0.5 ** (age / half_life_years)
+    age = np.maximum(0, current_year - years)
+    weights = np.power(0.5, age / half_life_years)
+    weights[years == 0] = 0.25  # unknown year gets small but nonzero weight
+    return weights
 
 def _build_keyword_recency_weights(pub_text: str, methods_keywords: list[str], current_year: int = 2026) -> dict:
     """
@@ -83,24 +207,42 @@ def _build_keyword_recency_weights(pub_text: str, methods_keywords: list[str], c
     Returns a normalized dict: {keyword: weight in [0,1]}.
     """
     lines = _split_pub_lines(pub_text)
-    scores = defaultdict(float)
 
     # pre-lower keywords
     kws = [k.strip() for k in (methods_keywords or []) if str(k).strip()]
     kws_lower = [(k, k.lower()) for k in kws]
 
-    for line in lines:
-        line_l = line.lower()
-        y = _extract_year_from_line(line)
-        w = _year_weight(y, current_year=current_year)
+    originals = defaultdict(list)  # lowered keyword -> original spellings
+    for original_kw, kw_l in kws_lower:
+        originals[kw_l].append(original_kw)
+    if not lines or not originals:
+        return {}
+
+    find_keywords = keyword_matcher(tuple(originals))
+    kw_ids = {kw_l: j for j, kw_l in enumerate(originals)}
 
-        for original_kw, kw_l in kws_lower:
-            # simple substring match; good enough for v1
-            if kw_l in line_l:
-                scores[original_kw] += w
+    # One (line, keyword id) pair per match; a keyword counts once per line,
+    # however often it occurs
+    hit_lines: list[int] = []
+    hit_kws: list[int] = []
+    for i, line in enumerate(lines):
+        for kw_l in find_keywords(line.lower()):
+            hit_lines.append(i)
+            hit_kws.append(kw_ids[kw_l])
 
-    if not scores:
+    if not hit_kws:
         return {}
 
-    maxv = max(scores.values()) or 1.0
-    return {k: round(v / maxv, 4) for k, v in scores.items()}
\ No newline at end of file
+    years = np.array([_extract_year_from_line(line) or 0 for line in lines], dtype=np.int32)
+    weights = _year_weights(years, current_year=current_year)
+
+    # Recency-weighted mention count per keyword id, accumulated in one bincount
+    scores = np.bincount(hit_kws, weights=weights[hit_lines], minlength=len(kw_ids))
+    hit = np.bincount(hit_kws, minlength=len(kw_ids)) > 0
+
+    maxv = float(scores.max()) or 1.0
+    return {
+        original_kw: round(float(scores[j]) / maxv, 4)
+        for kw_l, j in kw_ids.items() if hit[j]
+        for original_kw in originals[kw_l]
+    }